@@ -1,84 +1,144 @@
 import os
 import re
 import csv
+import heapq
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from operator import itemgetter
 from os.path import join
 import pdfplumber  # Library to extract text and tables from PDFs
-from rapidfuzz import fuzz  # Library for fuzzy string matching
+from rapidfuzz import fuzz, process  # Library for fuzzy string matching
 from itertools import combinations
 
+# Module logger; per-file matching details are logged at DEBUG level
+logger = logging.getLogger(__name__)
+
 # File paths (update these with your actual file locations)
 pdf_path = "your file path"          # Path to the PDF file to process
 csv_directory = "your file path"     # Directory containing CSV files for matching
 output_csv = "your file path"        # Path where the output CSV will be saved
 
+# CSV fields written to the output, in the order they are stored by load_csv_data;
+# each stored row also carries the matching cost and quantity after these fields
+_CSV_FIELDS = ("Description", "Unit Cost", "Total Quantity", "Agreement Name")
+
+# ---------------------------- Regular Expressions ----------------------------
+
+# Patterns are compiled once at import time instead of on every call
+_SUB_PREFIX_RE = re.compile(r"^\d{8}\s+Subscription\s+#\d{7}:\s+")  # Description prefix
+_CUST_PREFIX_RE = re.compile(r"^\d{10}\s*|[\n\r]+")  # Customer ID prefix and line breaks
+_NON_NUM_RE = re.compile(r"[^\d.]")  # Anything except digits and the decimal point
+_NORMALIZE_RE = re.compile(r"[^a-zA-Z0-9\s]")  # Anything except letters, digits and spaces
+_TRAIL_NUM_RE = re.compile(r"\s*\d+$")  # Trailing number, e.g. "Company 2"
+
 # ---------------------------- PDF Extraction ----------------------------
 
-def extract_pdf(pdf_path):
+# PDFs with at most this many pages are extracted in-process, since starting
+# worker processes would cost more than it saves
+_MIN_PARALLEL_PAGES = 8
+
+def _iter_tables(pdf_path, first_page, last_page):
     """
-    Extracts table data from a PDF and returns a list of dictionaries,
-    where each dictionary represents a row of data with cleaned fields.
+    Yields the table of each page from first_page up to (but not including)
+    last_page (0-based) that contains table data, as a list of rows.
+    The PDF is opened once for the whole range.
     """
-    pdf_data = []  # List to store extracted PDF records
-    # Open the PDF file using pdfplumber
-    with pdfplumber.open(pdf_path) as pdf:
-        # Iterate over each page in the PDF
+    # Open only this page range (pdfplumber page numbers are 1-based)
+    with pdfplumber.open(pdf_path, pages=range(first_page + 1, last_page + 1)) as pdf:
         for page in pdf.pages:
             # Attempt to extract a table from the current page
             table = page.extract_table()
-            # Only process pages that contain table data
+            # Release the page's cached characters and text map before moving on
+            page.close()
+            # Only return pages that contain table data
             if table:
-                # Skip the header row (assumes first row is header)
-                data_rows = table[1:]
-                # Process each row in the table
-                for row in data_rows:
-                    # Only process rows that have at least 11 columns
-                    if len(row) >= 11:
-                        # Clean and extract the description field (assumes index 4 holds the description)
-                        original_description = row[4].strip() if row[4] else ""
-                        # Remove any unwanted prefix using a regular expression
-                        cleaned_description = re.sub(
-                            r"^\d{8}\s+Subscription\s+#\d{7}:\s+",
-                            "",
-                            original_description,
-                        )
-
-                        # Extract and clean the customer field (assumes index 1 holds customer info)
-                        original_customer = row[1].strip() if row[1] else ""
-                        # Remove a 10-digit prefix and any newline characters
-                        cleaned_customer = re.sub(
-                            r"^\d{10}\s*|[\n\r]+", " ", original_customer
-                        )
-
-                        # Extract and clean the quantity field (assumes index 8 holds quantity)
-                        original_qty = row[8].strip() if row[8] else ""
-                        # Remove any non-numeric characters (except decimal point)
-                        cleaned_qty = re.sub(r"[^\d.]", "", original_qty)
-                        # Convert quantity to an integer (default to 0 if empty)
-                        cleaned_qty = int(float(cleaned_qty)) if cleaned_qty else 0
-                        cleaned_qty = cleaned_qty if cleaned_qty else "0"  # default to "0" if empty
-
-                        # Extract and clean the net unit price (assumes index 9 holds the price)
-                        original_price = row[9].strip() if row[9] and row[9].strip() else "0.00"
-                        # Remove commas and convert to a float
-                        cleaned_price = float(original_price.replace(",", ""))
-
-                        # Extract and clean the total amount (assumes index 10 holds the total)
-                        total_amount = row[10].strip() if row[10] and row[10].strip() else "0.00"
-                        cleaned_total_amount = float(total_amount.replace(",", ""))
-
-                        # Append the cleaned record as a dictionary to the pdf_data list
-                        pdf_data.append(
-                            {
-                                "Number": row[0],  # Record identifier
-                                "End-Customer": cleaned_customer,
-                                "Description": cleaned_description,
-                                "Net Unit Price": cleaned_price,
-                                "Qty": int(float(cleaned_qty)),
-                                "Total Amount": cleaned_total_amount,
-                                "SO/PO Number": row[5].strip() if row[5] else "",  # Sales/PO number
-                            }
-                        )
-    return pdf_data
+                yield table
+
+def _iter_records(pdf_path, first_page, last_page):
+    """
+    Extracts table data from a range of PDF pages (see _iter_tables) and
+    yields one dictionary per row, with cleaned fields.
+    """
+    # Process the table found on each page
+    for table in _iter_tables(pdf_path, first_page, last_page):
+        # Skip the header row (assumes first row is header)
+        data_rows = table[1:]
+        # Process each row in the table
+        for row in data_rows:
+            # Only process rows that have at least 11 columns
+            if len(row) >= 11:
+                # Clean and extract the description field (assumes index 4 holds the description)
+                original_description = row[4].strip() if row[4] else ""
+                # Remove any unwanted prefix using a regular expression
+                cleaned_description = _SUB_PREFIX_RE.sub("", original_description)
+
+                # Extract and clean the customer field (assumes index 1 holds customer info)
+                original_customer = row[1].strip() if row[1] else ""
+                # Remove a 10-digit prefix and any newline characters
+                cleaned_customer = _CUST_PREFIX_RE.sub(" ", original_customer)
+
+                # Extract and clean the quantity field (assumes index 8 holds quantity);
+                # removing non-numeric characters (except decimal point) also drops whitespace
+                cleaned_qty = _NON_NUM_RE.sub("", row[8] or "")
+                # Convert quantity to an integer (default to 0 if empty)
+                cleaned_qty = int(float(cleaned_qty)) if cleaned_qty else 0
+
+                # Extract and clean the net unit price (assumes index 9 holds the price)
+                original_price = (row[9] or "").strip() or "0.00"
+                # Remove commas and convert to a float
+                cleaned_price = float(original_price.replace(",", ""))
+
+                # Extract and clean the total amount (assumes index 10 holds the total)
+                total_amount = (row[10] or "").strip() or "0.00"
+                cleaned_total_amount = float(total_amount.replace(",", ""))
+
+                # Yield the cleaned record as a dictionary
+                yield {
+                    "Number": row[0],  # Record identifier
+                    "End-Customer": cleaned_customer,
+                    "Description": cleaned_description,
+                    "Net Unit Price": cleaned_price,
+                    "Qty": cleaned_qty,
+                    "Total Amount": cleaned_total_amount,
+                    "SO/PO Number": row[5].strip() if row[5] else "",  # Sales/PO number
+                }
+
+def _extract_pages(pdf_path, first_page, last_page):
+    """
+    Returns the cleaned records of a range of PDF pages as a list.
+    The PDF is opened here rather than passed in, because PDF objects
+    cannot be pickled; this lets each range run in a separate worker process.
+    """
+    return list(_iter_records(pdf_path, first_page, last_page))
+
+def iter_pdf(pdf_path):
+    """
+    Extracts table data from a PDF and yields one dictionary per row,
+    where each dictionary represents a row of data with cleaned fields.
+    Larger PDFs are split into one contiguous page range per worker process,
+    so each worker opens the document only once; results are yielded in page order.
+    """
+    # Count the pages up front so they can be distributed to the workers
+    with pdfplumber.open(pdf_path) as pdf:
+        num_pages = len(pdf.pages)
+
+    # Never start more workers than there are pages
+    workers = min(os.cpu_count() or 1, num_pages)
+    if num_pages <= _MIN_PARALLEL_PAGES or workers < 2:
+        # Small PDFs are streamed page by page in this process
+        yield from _iter_records(pdf_path, 0, num_pages)
+        return
+
+    # Table extraction is CPU-bound, so spread contiguous page ranges across processes
+    chunk_size = -(-num_pages // workers)  # Ceiling division
+    first_pages = range(0, num_pages, chunk_size)
+    last_pages = [min(first_page + chunk_size, num_pages) for first_page in first_pages]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for page_data in executor.map(_extract_pages, repeat(pdf_path), first_pages, last_pages):
+            yield from page_data
 
 # ---------------------------- String Normalization ----------------------------
 
@@ -87,163 +147,292 @@ def normalize_string(s):
     Normalize a string by converting it to lowercase and removing any
     non-alphanumeric characters (except spaces) to standardize it for matching.
     """
-    return re.sub(r'[^a-zA-Z0-9\s]', '', s).strip().lower()
+    return _NORMALIZE_RE.sub('', s).strip().lower()
 
 # Note: There were two definitions of normalize_string. The second one overwrites the first,
 # so we keep only one consistent function for normalization.
 
 # ---------------------------- CSV Matching ----------------------------
 
-def find_matching_csv_files(company_name, csv_directory):
+@lru_cache(maxsize=1)
+def _list_csv_files(csv_directory):
+    """
+    Scans the directory once and returns three parallel tuples for its CSV
+    files: the normalized base names, the same names without trailing
+    numbers, and the full paths. The result is cached, so the directory is
+    only read and the fuzzy-matching choices are only built once per run.
+    """
+    normalized_names, names_without_number, file_paths = [], [], []
+    # scandir yields DirEntry objects, so filtering by name needs no extra stat calls
+    with os.scandir(csv_directory) as entries:
+        for entry in entries:
+            # Process only CSV files
+            if entry.name.endswith(".csv"):
+                # Remove the file extension and normalize the filename
+                normalized_filename = normalize_string(os.path.splitext(entry.name)[0])
+                normalized_names.append(normalized_filename)
+                # Remove trailing numbers from the filename for improved fuzzy matching
+                names_without_number.append(_TRAIL_NUM_RE.sub("", normalized_filename))
+                file_paths.append(entry.path)
+    return tuple(normalized_names), tuple(names_without_number), tuple(file_paths)
+
+def build_csv_index(csv_directory):
+    """
+    Builds a dictionary mapping each normalized CSV base name in the directory
+    to its full file path, so exact company matches are a single lookup.
+    """
+    normalized_names, _, file_paths = _list_csv_files(csv_directory)
+    return dict(zip(normalized_names, file_paths))
+
+def find_matching_csv_files(company_name, csv_directory, csv_index=None):
     """
     Finds CSV files in the specified directory that match the given company name.
     Uses both exact matching and fuzzy matching (with a threshold of 80).
+    If a prebuilt csv_index is given, it is used for the exact match lookup.
     Returns a list containing at most one matched CSV file path.
     """
-    matching_files = []  # List to collect potential matching CSV file paths
     # Normalize the company name for comparison
     normalized_company_name = normalize_string(company_name)
 
-    print(f"Looking for a match for: {company_name} (normalized: {normalized_company_name})")
+    logger.debug("Looking for a match for: %s (normalized: %s)", company_name, normalized_company_name)
 
-    # Iterate over all files in the CSV directory
-    for filename in os.listdir(csv_directory):
-        # Process only CSV files
-        if filename.endswith(".csv"):
-            # Remove the file extension and normalize the filename
-            base_name = os.path.splitext(filename)[0]
-            normalized_filename = normalize_string(base_name)
+    if csv_index is None:
+        csv_index = build_csv_index(csv_directory)
 
-            print(f"Checking file: {filename} (normalized: {normalized_filename})")
+    # First, try to find an exact match between the normalized company name and filename
+    if normalized_company_name in csv_index:
+        logger.debug("Exact match found: %s", csv_index[normalized_company_name])
+        return [csv_index[normalized_company_name]]
 
-            # First, try to find an exact match between the normalized company name and filename
-            if normalized_company_name == normalized_filename:
-                print(f"Exact match found: {filename}")
-                return [os.path.join(csv_directory, filename)]
-            
-            # Remove trailing numbers from the filename for improved fuzzy matching
-            base_without_number = re.sub(r"\s*\d+$", "", normalized_filename)
-
-            # Use fuzzy matching with a threshold of 80 for flexibility
-            if fuzz.ratio(normalized_company_name, normalized_filename) > 80 or \
-               fuzz.ratio(normalized_company_name, base_without_number) > 80:
-                print(f"Fuzzy match found: {filename}")
-                matching_files.append(os.path.join(csv_directory, filename))
-    
-    # If multiple matching files are found, warn and return the first match
-    if len(matching_files) > 1:
-        print(f"Warning: Multiple CSV files found for {company_name}. Returning the first match.")
+    # The candidate names and their file paths are cached per directory
+    choices, choices_without_number, file_paths = _list_csv_files(csv_directory)
+
+    # Use fuzzy matching with a threshold of 80 for flexibility; extractOne scores
+    # every candidate in a single native call and returns the best one
+    best = process.extractOne(
+        normalized_company_name, choices, scorer=fuzz.ratio, score_cutoff=80
+    )
+    if not best or best[1] <= 80:
+        # Retry with trailing numbers removed from the filenames (e.g. "acme corp 2")
+        best = process.extractOne(
+            normalized_company_name, choices_without_number, scorer=fuzz.ratio, score_cutoff=80
+        )
 
     # If no matches were found, log that information
-    if not matching_files:
-        print(f"No matching files found for {company_name}")
+    if not best or best[1] <= 80:
+        logger.debug("No matching files found for %s", company_name)
+        return []
 
-    # Return only the first matching file (or an empty list if none were found)
-    return matching_files[:1]
+    # extractOne returns (choice, score, index); map the index back to its file path
+    logger.debug("Fuzzy match found: %s", file_paths[best[2]])
+    return [file_paths[best[2]]]
 
     # Note: The code below this return statement is unreachable and can be removed.
 
+def _find_columns(header):
+    """
+    Scans a CSV header and returns the positions of the description,
+    unit cost, total quantity and agreement name output columns, followed by
+    the cost and quantity columns used for matching (None for any that are missing).
+    Output columns are matched by name, as DictReader keys would be; Unit Cost and
+    Total Quantity fall back to the matching columns when they are absent.
+    The matching columns are the first whose names contain "cost" or "quantity".
+    """
+    # Like DictReader, a repeated name keeps its first position in order but its last value
+    positions = {name: index for index, name in enumerate(header)}
+    cost = qty = None
+    for name, index in positions.items():
+        lowered = name.lower()
+        if cost is None and "cost" in lowered:
+            cost = index
+        if qty is None and "quantity" in lowered:
+            qty = index
+    return (
+        positions.get("Description"),
+        positions.get("Unit Cost", cost),
+        positions.get("Total Quantity", qty),
+        positions.get("Agreement Name"),
+        cost,
+        qty,
+    )
+
 def load_csv_data(csv_file_paths):
     """
     Loads CSV data from a list of CSV file paths.
-    Returns a list of dictionaries, where each dictionary represents a CSV row.
+    The relevant columns are located once from each file's header row.
+    Returns a list of (description, unit cost, total quantity, agreement name,
+    matching cost, matching quantity) tuples, one per CSV row; the first four
+    are the output fields in the order of _CSV_FIELDS.
     """
     csv_data = []
     # Iterate over each file path in the provided list
     for file_path in csv_file_paths:
         with open(file_path, newline='', encoding='utf-8') as csvfile:
-            # Use DictReader to read CSV rows as dictionaries
-            reader = csv.DictReader(csvfile)
+            # Use a plain reader so each row is a list rather than a new dictionary
+            reader = csv.reader(csvfile)
             # Strip any leading or trailing whitespace from the CSV header names
-            reader.fieldnames = [name.strip() for name in reader.fieldnames]
-            # Append each row dictionary to the csv_data list
+            header = [name.strip() for name in next(reader, [])]
+
+            # Locate the selected columns once from the header
+            columns = _find_columns(header)
+            # Values to use when a column is missing from the file or the row
+            defaults = ("No Description Found", "0", "0", "No Agreement Found", "0", "0")
+            # When every column is present, full-length rows can be sliced with one itemgetter
+            get_fields = itemgetter(*columns) if None not in columns else None
+            min_length = max(columns) + 1 if get_fields else 0
+
+            # Append each row as a tuple of the selected fields to the csv_data list
             for row in reader:
-                csv_data.append(row)
+                # Skip blank lines, as DictReader would
+                if not row:
+                    continue
+                if get_fields and len(row) >= min_length:
+                    csv_data.append(get_fields(row))
+                else:
+                    csv_data.append(tuple(
+                        row[index] if index is not None and index < len(row) else default
+                        for index, default in zip(columns, defaults)
+                    ))
     return csv_data
 
-def extract_matching_csv_data(company_name, csv_directory):
+def extract_matching_csv_data(company_name, csv_directory, csv_index=None):
     """
     Extracts CSV data for a given company name by finding the matching CSV file.
     If exactly one CSV file matches, its data is loaded and returned.
     If there is no match or multiple matches, an empty list is returned.
     """
-    matching_files = find_matching_csv_files(company_name, csv_directory)
+    matching_files = find_matching_csv_files(company_name, csv_directory, csv_index)
     
     if len(matching_files) == 1:
         # Load and return CSV data from the single matched file
         return load_csv_data(matching_files)
     else:
         # Log a warning if there isn't exactly one matching CSV file
-        print(f"Warning: Expected one CSV file for {company_name}, found {len(matching_files)}.")
+        logger.warning("Expected one CSV file for %s, found %d.", company_name, len(matching_files))
         return []
 
-def find_matching_additions(pdf_record, csv_data):
+def prepare_csv(csv_data):
+    """
+    Converts loaded CSV rows into a structure ready for repeated matching.
+    Descriptions are normalized once here, and the rows are indexed by their
+    (cost, quantity) pair so that exact matches are a single dictionary lookup.
+    Returns a dictionary with the original rows, normalized descriptions
+    and the (cost, quantity) index.
+    """
+    # Map each (cost, quantity) pair to the positions of the CSV rows that have it
+    by_cost_qty = defaultdict(list)
+    for index, (_, _, _, _, cost, qty) in enumerate(csv_data):
+        # Retrieve cost and quantity values from CSV, removing commas if needed,
+        # and convert the quantity to an integer safely
+        csv_cost = float((cost or "0").replace(",", ""))
+        csv_qty = int(float((qty or "0").replace(",", "")))
+        by_cost_qty[(csv_cost, csv_qty)].append(index)
+    return {
+        "rows": csv_data,
+        # Normalize the CSV descriptions for fuzzy matching
+        "descriptions": [normalize_string(row[0]) for row in csv_data],
+        "by_cost_qty": by_cost_qty,
+    }
+
+def pdf_cost_qty(pdf_record):
     """
-    Compares a single PDF record with CSV data rows to find matching records.
+    Returns the (cost, quantity) key of a PDF record, matching the keys of
+    the prepare_csv index. The cost is cleaned of commas in case it is still
+    a formatted string.
+    """
+    return float(str(pdf_record["Net Unit Price"]).replace(",", "")), int(pdf_record["Qty"])
+
+def find_matching_additions(pdf_record, company_csv, top_k=None):
+    """
+    Compares a single PDF record with prepared CSV data (see prepare_csv)
+    to find matching records.
     It uses the 'Net Unit Price' and 'Qty' for an exact match and
     fuzzy string matching for the description.
+    If top_k is given, only the top_k most relevant matches are returned.
     Returns a list of matches sorted by the relevance score (highest first).
     """
     matches = []
     # Normalize the PDF description for fuzzy matching
     pdf_description = normalize_string(pdf_record["Description"])
-    pdf_cost = pdf_record["Net Unit Price"]
-    pdf_qty = pdf_record["Qty"]
+    # Clean the PDF cost and quantity once, for an exact comparison with the CSV
+    pdf_cost, pdf_qty = pdf_cost_qty(pdf_record)
+
+    # Look up only the CSV rows where both cost and quantity match exactly
+    candidates = company_csv["by_cost_qty"].get((pdf_cost, pdf_qty), ())
+
+    # Track the single best match when only the top one is needed
+    best_index, best_relevance = None, None
+
+    # Only the candidate rows need a relevance score
+    for index in candidates:
+        # Compute the fuzzy matching score between PDF and CSV descriptions
+        relevance = fuzz.ratio(pdf_description, company_csv["descriptions"][index])
+
+        if top_k == 1:
+            # Keep only the best score seen so far (the first row wins ties, as in a stable sort)
+            if best_relevance is None or relevance > best_relevance:
+                best_index, best_relevance = index, relevance
+            continue
+
+        # Label the output CSV fields (zip stops before the matching cost and quantity)
+        filtered_data = dict(zip(_CSV_FIELDS, company_csv["rows"][index]))
+        # Append the match along with its relevance score
+        matches.append({"data": filtered_data, "relevance": relevance})
+
+    if top_k == 1:
+        if best_index is None:
+            return []
+        filtered_data = dict(zip(_CSV_FIELDS, company_csv["rows"][best_index]))
+        return [{"data": filtered_data, "relevance": best_relevance}]
+    if top_k is not None:
+        # Partial sort: only the top_k matches are ordered
+        return heapq.nlargest(top_k, matches, key=itemgetter("relevance"))
 
-    # Define which CSV fields to keep when a match is found
-    selected_fields = ["Description", "Unit Cost", "Total Quantity", "Agreement Name"]
-    
-    # Iterate over each CSV row to find potential matches
-    for row in csv_data:
-        # Ensure keys in the CSV row are trimmed of whitespace
-        row = {key.strip(): value for key, value in row.items()}
-        # Normalize the CSV description (default text if missing)
-        csv_description = normalize_string(row.get("Description", "No Description Found"))
-        
-        # Dynamically determine which column contains cost and quantity info
-        cost_column = next((col for col in row.keys() if "cost" in col.lower()), None)
-        qty_column = next((col for col in row.keys() if "quantity" in col.lower()), None)
-        agreement_name = row.get("Agreement Name", "No Agreement Found")
-       
-        # Retrieve cost and quantity values from CSV, removing commas if needed
-        csv_cost = row.get(cost_column, "0").replace(",", "") if cost_column else "0"
-        csv_qty = row.get(qty_column, "0").replace(",", "") if qty_column else "0"
-        # Convert CSV quantity to an integer safely
-        csv_qty = int(float(csv_qty))
-        
-        # Clean the PDF cost to ensure correct float comparison
-        pdf_cost_cleaned = float(str(pdf_cost).replace(",", ""))
-        
-        # Check if both cost and quantity match exactly between PDF and CSV record
-        if float(csv_cost) == float(pdf_cost) and int(csv_qty) == int(pdf_qty):
-            # Compute the fuzzy matching score between PDF and CSV descriptions
-            relevance = fuzz.ratio(pdf_description, csv_description)
-            # Filter CSV data to only include selected fields for the output
-            filtered_data = {key: value for key, value in row.items() if key in selected_fields}
-            # Append the match along with its relevance score
-            matches.append({"data": filtered_data, "relevance": relevance})
-    
     # Return matches sorted by descending relevance (highest score first)
     return sorted(matches, key=lambda x: x["relevance"], reverse=True)
 
-def get_pdf_matches(pdf_path, csv_directory):
+def make_company_loader(csv_directory):
+    """
+    Returns a memoized function that loads and prepares the CSV data for a
+    company name. The directory is indexed once, and each unique company only
+    pays the file lookup and CSV parsing cost the first time it is seen.
+    """
+    csv_index = build_csv_index(csv_directory)
+
+    @lru_cache(maxsize=None)
+    def load_company_csv(company_name):
+        return prepare_csv(extract_matching_csv_data(company_name, csv_directory, csv_index))
+
+    return load_company_csv
+
+def get_pdf_matches(pdf_path, csv_directory, top_k=None):
     """
     Processes the PDF file to extract records, then for each record, finds the corresponding
     CSV data based on the 'End-Customer' field. It then finds matching CSV rows based on cost,
     quantity, and fuzzy matching of descriptions.
+    Records whose 'Number' was already seen are skipped before any matching is done.
+    If top_k is given, only the top_k matches per record are kept (all by default).
     Returns a list of dictionaries with both PDF data and its corresponding matches.
     """
-    pdf_data = extract_pdf(pdf_path)
+    # Cache CSV lookups so repeated companies reuse the already-loaded data
+    load_company_csv = make_company_loader(csv_directory)
+
     matches = []
-    # Iterate through each record extracted from the PDF
-    for pdf_record in pdf_data:
+    # Set to track seen record numbers so duplicate rows are never matched
+    seen_numbers = set()
+    # Consume the PDF rows as they are extracted
+    for pdf_record in iter_pdf(pdf_path):
+        # Skip records that have already been processed (avoid duplicates)
+        if pdf_record["Number"] in seen_numbers:
+            continue
+        seen_numbers.add(pdf_record["Number"])
         # Use the 'End-Customer' field to determine which CSV file to search
-        company_name = pdf_record["End-Customer"]
-        csv_data = extract_matching_csv_data(company_name, csv_directory)
-        # Find matching additions between the PDF record and CSV data
+        company_csv = load_company_csv(pdf_record["End-Customer"])
+        # Find matching additions between the PDF record and CSV data; each record
+        # only has a few exact cost/quantity candidates, so they are scored directly
         matching_records = [
             {"score": m["relevance"], "data": m["data"]}
-            for m in find_matching_additions(pdf_record, csv_data)
+            for m in find_matching_additions(pdf_record, company_csv, top_k)
         ]
         # Append the PDF record and its matches to the results list
         matches.append({ "pdf": pdf_record, "matches": matching_records })
@@ -254,13 +443,13 @@ def find_unmatched_pdf_records(pdf_path, csv_directory):
     Identifies and returns PDF records that do not have any matching CSV record.
     Useful for troubleshooting missing or incomplete matches.
     """
-    pdf_data = extract_pdf(pdf_path)
+    load_company_csv = make_company_loader(csv_directory)
     unmatched_records = []
-    # Iterate through each PDF record
-    for record in pdf_data:
+    # Iterate through each PDF record as it is extracted
+    for record in iter_pdf(pdf_path):
         company_name = record["End-Customer"]
-        csv_data = extract_matching_csv_data(company_name, csv_directory)
-        matching_records = find_matching_additions(record, csv_data)
+        company_csv = load_company_csv(company_name)
+        matching_records = find_matching_additions(record, company_csv)
         # If no matching CSV records are found, add the PDF record to the unmatched list
         if not matching_records:
             unmatched_records.append(record)
@@ -268,38 +457,60 @@ def find_unmatched_pdf_records(pdf_path, csv_directory):
 
 # ---------------------------- Writing Results to CSV ----------------------------
 
-# Get the list of matches by comparing PDF data to CSV data
-matches = get_pdf_matches(pdf_path, csv_directory)
-
-# Define CSV headers for the output file
-headers = [
-    "Number", "End-Customer", "Description", "Qty", "Net Unit Price",
-    "Total Amount", "SO/PO Number", "Match Description", "Match Cost",
-    "Match Quantity", "Agreement Name", "Match Score"
-]
-
-# Set to track seen record numbers to avoid writing duplicate rows
-seen_numbers = set()
-
-# Open the output CSV file for writing the results
-with open(output_csv, mode="w", newline="", encoding="utf-8") as file:
-    writer = csv.writer(file)
-    writer.writerow(headers)  # Write the header row
-    
-    # Iterate over each PDF record and its matches
-    for entry in matches:
-        pdf = entry['pdf']
-        matches_for_record = entry['matches']
-        number = pdf['Number']
-        
-        # Skip records that have already been processed (avoid duplicates)
-        if number in seen_numbers:
-            continue
-        seen_numbers.add(number)
-        
-        # If there are matching CSV records, write each match as a separate row
-        if matches_for_record:
-            for match in matches_for_record:
+def main():
+    """
+    Runs the full reconciliation: matches the PDF records against the CSV files
+    and writes the consolidated results to the output CSV.
+    """
+    # Log at INFO by default; set the level to DEBUG to trace every CSV file lookup
+    logging.basicConfig(level=logging.INFO)
+
+    # Get the list of matches by comparing PDF data to CSV data (duplicates already removed)
+    matches = get_pdf_matches(pdf_path, csv_directory)
+
+    # Define CSV headers for the output file
+    headers = [
+        "Number", "End-Customer", "Description", "Qty", "Net Unit Price",
+        "Total Amount", "SO/PO Number", "Match Description", "Match Cost",
+        "Match Quantity", "Agreement Name", "Match Score"
+    ]
+
+    # Number of buffered rows to collect before handing them to the writer
+    write_batch_size = 10_000
+
+    # Open the output CSV file for writing the results (with a 1 MB write buffer)
+    with open(output_csv, mode="w", newline="", encoding="utf-8", buffering=1024 * 1024) as file:
+        writer = csv.writer(file)
+        writer.writerow(headers)  # Write the header row
+
+        # Rows are collected here and written in batches with writerows
+        out_rows = []
+
+        # Iterate over each PDF record and its matches
+        for entry in matches:
+            pdf = entry['pdf']
+            matches_for_record = entry['matches']
+            
+            # If there are matching CSV records, write each match as a separate row
+            if matches_for_record:
+                for match in matches_for_record:
+                    row = [
+                        pdf['Number'],
+                        pdf['End-Customer'],
+                        pdf['Description'],
+                        pdf['Qty'],
+                        pdf['Net Unit Price'],
+                        pdf['Total Amount'],
+                        pdf['SO/PO Number'],
+                        match['data']['Description'],
+                        match['data']['Unit Cost'],
+                        match['data']['Total Quantity'],
+                        match['data']['Agreement Name'],
+                        match['score']
+                    ]
+                    out_rows.append(row)
+            else:
+                # If no match was found, write the PDF record with blank fields for CSV data
                 row = [
                     pdf['Number'],
                     pdf['End-Customer'],
@@ -308,23 +519,17 @@ with open(output_csv, mode="w", newline="", encoding="utf-8") as file:
                     pdf['Net Unit Price'],
                     pdf['Total Amount'],
                     pdf['SO/PO Number'],
-                    match['data']['Description'],
-                    match['data']['Unit Cost'],
-                    match['data']['Total Quantity'],
-                    match['data']['Agreement Name'],
-                    match['score']
+                    "", "", "", ""
                 ]
-                writer.writerow(row)
-        else:
-            # If no match was found, write the PDF record with blank fields for CSV data
-            row = [
-                pdf['Number'],
-                pdf['End-Customer'],
-                pdf['Description'],
-                pdf['Qty'],
-                pdf['Net Unit Price'],
-                pdf['Total Amount'],
-                pdf['SO/PO Number'],
-                "", "", "", ""
-            ]
-            writer.writerow(row)
+                out_rows.append(row)
+
+            # Write out a full batch to keep the buffer bounded on very large outputs
+            if len(out_rows) >= write_batch_size:
+                writer.writerows(out_rows)
+                out_rows.clear()
+
+        # Write any remaining buffered rows
+        writer.writerows(out_rows)
+
+if __name__ == "__main__":
+    main()